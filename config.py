@@ -55,6 +55,9 @@ ZOHO_API_BASE_URL = get_credential("ZOHO_API_BASE_URL", "https://www.zohoapis.co
 ZOHO_TOKEN_URL = get_credential("ZOHO_TOKEN_URL", "https://accounts.zoho.com/oauth/v2/token")
 ZOHO_WORKDRIVE_API_URL = get_credential("ZOHO_WORKDRIVE_API_URL", "https://workdrive.zoho.com/api/v1")
 
+# Set to "false" to disable in-process caching of Zoho lookups (e.g. when testing)
+ZOHO_CACHE_ENABLED = str(get_credential("ZOHO_CACHE_ENABLED", "true")).lower() != "false"
+
 if __name__ == "__main__":
     # Test the credential loading
     print(f"OpenAI API Key available: {bool(OPENAI_API_KEY)}")
@@ -2,13 +2,38 @@
 import requests # Will be used for actual API calls
 import json # For pretty printing and the new parser
 import os
+import re
 import time
-import base64 # For encoding file data
+import random # For retry jitter
+import binascii # For decoding base64 image data
 import logging
+import threading
+import traceback
+import concurrent.futures # For parallel Zoho requests
+import copy
+import functools
 import io # For file handling
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Tuple # For type hinting
-from PIL import Image # For image processing
+from typing import Optional, Dict, Any, List, Tuple, TypedDict # For type hinting
+from PIL import Image, features # For image processing
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Try to import orjson for faster JSON decoding of Zoho responses
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Try to import requests-toolbelt so uploads can stream multipart bodies
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+    TOOLBELT_AVAILABLE = True
+except ImportError:
+    TOOLBELT_AVAILABLE = False
+
+logger = logging.getLogger('zoho_adapter')
 
 # Import credentials from shared config module (works with both Streamlit secrets and .env)
 from config import (
@@ -17,19 +42,167 @@ from config import (
     ZOHO_REFRESH_TOKEN,
     ZOHO_API_BASE_URL,
     ZOHO_TOKEN_URL,
-    ZOHO_WORKDRIVE_API_URL
+    ZOHO_WORKDRIVE_API_URL,
+    ZOHO_CACHE_ENABLED
 )
 
+# Shared session so all calls to Zoho (CRM, accounts and WorkDrive) reuse pooled
+# keep-alive connections instead of paying a new TCP/TLS handshake on every request.
+# Retries only apply to idempotent methods; POSTs (note creation, uploads) are never
+# replayed automatically, and uploads keep their own rate-limit handling.
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "Accept": "application/json",
+    "User-Agent": f"metalpromo-design-generator {requests.utils.default_user_agent()}"
+})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+))
+_DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+_UPLOAD_TIMEOUT = (3.05, 60)  # File uploads can take longer to be acknowledged
+
+# Separate pooled session for downloading generated design images from the image
+# host, so designs after the first reuse its keep-alive connections. Kept apart from
+# _SESSION since those requests don't go to Zoho and shouldn't send its JSON headers.
+_DOWNLOAD_SESSION = requests.Session()
+_DOWNLOAD_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+))
+
+def _json_loads(content: bytes) -> Any:
+    """
+    Decodes a JSON response body, using orjson when available.
+    Both decoders raise a ValueError subclass on invalid input.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def _json_pretty(value: Any) -> str:
+    """Pretty-prints a JSON-compatible value for debug logging, using orjson when available."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(value, indent=2)
+
+def _response_snippet(response: Optional[requests.Response], limit: int = 2048) -> str:
+    """
+    Returns the start of a response body for logging. Decoding a bounded slice of the
+    raw bytes avoids response.text's charset detection and huge HTML error pages.
+    """
+    if response is None:
+        return "N/A"
+    return response.content[:limit].decode('utf-8', 'replace')
+
+def _multipart_upload_kwargs(files: List[Tuple[bytes, str]]) -> Dict[str, Any]:
+    """
+    Builds the request kwargs for uploading (file_data, file_name) pairs, each sent as
+    its own 'content' part. With requests-toolbelt the multipart body is streamed from
+    the file bytes instead of being encoded into a second in-memory copy. The encoder
+    is consumed on send, so build one per attempt.
+    """
+    if TOOLBELT_AVAILABLE:
+        encoder = MultipartEncoder(fields=[
+            ('content', (file_name, io.BytesIO(file_data), 'application/octet-stream'))
+            for file_data, file_name in files
+        ])
+        return {'data': encoder, 'headers': {'Content-Type': encoder.content_type}}
+    return {'files': [
+        ('content', (file_name, file_data, 'application/octet-stream'))
+        for file_data, file_name in files
+    ]}
+
+def _ttl_cache(seconds: float, maxsize: int = 256, should_cache=None):
+    """
+    Decorator that memoizes a single-argument function for the given number of seconds.
+    Results for which should_cache returns False (e.g. error responses) are not stored.
+    Callers get a copy of the cached value, and the wrapped function gains cache_clear().
+    Caching is skipped entirely when ZOHO_CACHE_ENABLED is false.
+    """
+    def decorator(func):
+        cache: Dict[Any, Tuple[float, Any]] = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(key):
+            if not ZOHO_CACHE_ENABLED:
+                return func(key)
+
+            with lock:
+                entry = cache.get(key)
+                if entry and time.monotonic() < entry[0]:
+                    return copy.copy(entry[1])
+
+            result = func(key)
+            if should_cache is None or should_cache(result):
+                with lock:
+                    if len(cache) >= maxsize:
+                        # Drop expired entries first, then the oldest if still full
+                        now = time.monotonic()
+                        for stale_key in [k for k, (expires_at, _) in cache.items() if expires_at <= now]:
+                            del cache[stale_key]
+                        if len(cache) >= maxsize:
+                            del cache[next(iter(cache))]
+                    cache[key] = (time.monotonic() + seconds, copy.copy(result))
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+# Access tokens are cached per requested scope so repeated calls within the token
+# lifetime reuse the same token instead of round-tripping to the token endpoint.
+_TOKEN_CACHE: Dict[str, Dict[str, Any]] = {}
+_TOKEN_LOCK = threading.Lock()
+_TOKEN_EXPIRY_MARGIN = 60  # Refresh this many seconds before Zoho's reported expiry
+_REFRESH_TIMERS: Dict[str, threading.Timer] = {}  # Background refresh timer per scope
+# Uploads need CREATE to upload files and READ to get file details
+_WORKDRIVE_SCOPE = "WorkDrive.files.CREATE WorkDrive.files.READ"
+
 def get_access_token(scope: str = None):
     """
-    Refreshes and returns the Zoho API access token using the refresh token.
+    Returns a Zoho API access token, refreshing it with the refresh token only when
+    the cached token for the requested scope is missing or about to expire.
     Optionally requests specific scopes for the access token.
     
     Args:
         scope: Optional scope to request for the access token (e.g., 'ZohoCRM.modules.ALL,WorkDrive.files.ALL')
     """
+    cache_key = scope or ""
+    cached = _TOKEN_CACHE.get(cache_key)
+    if cached and time.monotonic() < cached["expires_at"] - _TOKEN_EXPIRY_MARGIN:
+        return cached["token"]
+
+    with _TOKEN_LOCK:
+        # Another thread may have refreshed the token while we were waiting for the lock
+        cached = _TOKEN_CACHE.get(cache_key)
+        if cached and time.monotonic() < cached["expires_at"] - _TOKEN_EXPIRY_MARGIN:
+            return cached["token"]
+        return _refresh_access_token(scope)
+
+def _refresh_access_token(scope: str = None):
+    """
+    Requests a new access token from Zoho using the refresh token and stores it in
+    the token cache along with its expiry time.
+    
+    Args:
+        scope: Optional scope to request for the access token
+    """
     if not all([ZOHO_CLIENT_ID, ZOHO_CLIENT_SECRET, ZOHO_REFRESH_TOKEN, ZOHO_TOKEN_URL]):
-        print("DEBUG: Zoho credentials (client ID, secret, refresh token, token URL) not fully configured in .env")
+        logger.debug("Zoho credentials (client ID, secret, refresh token, token URL) not fully configured in .env")
         return None
 
     payload = {
@@ -41,273 +214,433 @@ def get_access_token(scope: str = None):
     
     # Add scope if specified
     if scope:
-        print(f"DEBUG: Requesting access token with scope: {scope}")
+        logger.debug("Requesting access token with scope: %s", scope)
         payload['scope'] = scope
 
+    response = None
     try:
-        print(f"DEBUG: Token request payload: {payload}")
-        print(f"DEBUG: Requesting access token from {ZOHO_TOKEN_URL}")
-        response = requests.post(ZOHO_TOKEN_URL, data=payload)
+        logger.debug("Requesting access token from %s", ZOHO_TOKEN_URL)
+        response = _SESSION.post(ZOHO_TOKEN_URL, data=payload, timeout=_DEFAULT_TIMEOUT)
         response.raise_for_status()  # Raises HTTPError for bad responses (4XX or 5XX)
         
-        token_data = response.json()
+        token_data = _json_loads(response.content)
         access_token = token_data.get('access_token')
         
         if access_token:
-            print("DEBUG: Successfully obtained new access token from Zoho.")
-            # The token typically expires in 1 hour (3600 seconds). 
-            # You might want to store it with its expiry time if making frequent calls.
-            # For this app's lifecycle (single run per design request), fetching it once is likely fine.
+            logger.debug("Successfully obtained new access token from Zoho.")
+            # The token typically expires in 1 hour (3600 seconds)
+            expires_in = float(token_data.get('expires_in', 3600))
+            _TOKEN_CACHE[scope or ""] = {
+                "token": access_token,
+                "expires_at": time.monotonic() + expires_in
+            }
+            _schedule_token_refresh(scope, expires_in)
             return access_token
         else:
-            print(f"DEBUG: 'access_token' not found in Zoho's response. Response: {token_data}")
+            logger.debug("'access_token' not found in Zoho's response. Response: %s", token_data)
             return None
             
     except requests.exceptions.HTTPError as http_err:
-        print(f"DEBUG: HTTP error occurred while requesting Zoho token: {http_err} - Response: {response.text}")
+        logger.debug("HTTP error occurred while requesting Zoho token: %s - Response: %s", http_err, _response_snippet(response))
         return None
     except requests.exceptions.RequestException as req_err:
-        print(f"DEBUG: Request exception occurred while requesting Zoho token: {req_err}")
+        logger.debug("Request exception occurred while requesting Zoho token: %s", req_err)
         return None
     except ValueError as json_err: # Includes JSONDecodeError
-        print(f"DEBUG: JSON decoding error occurred while parsing Zoho token response: {json_err} - Response: {response.text}")
+        logger.debug("JSON decoding error occurred while parsing Zoho token response: %s - Response: %s", json_err, _response_snippet(response))
+        return None
+
+def _schedule_token_refresh(scope: Optional[str], expires_in: float):
+    """
+    Schedules a background refresh of the token for the given scope so it is renewed
+    before get_access_token would consider it stale, keeping callers off the token
+    endpoint. Must be called with _TOKEN_LOCK held.
+    """
+    cache_key = scope or ""
+    existing = _REFRESH_TIMERS.get(cache_key)
+    if existing:
+        existing.cancel()
+
+    delay = max(expires_in - 2 * _TOKEN_EXPIRY_MARGIN, 1)
+    timer = threading.Timer(delay, _refresh_token_in_background, args=(scope,))
+    timer.daemon = True  # Don't keep the process alive just to refresh tokens
+    _REFRESH_TIMERS[cache_key] = timer
+    timer.start()
+
+def _invalidate_access_token(scope: str = None, rejected_token: str = None):
+    """
+    Drops the cached token for a scope, e.g. after Zoho rejected it with a 401,
+    so the next get_access_token call fetches a fresh one. If rejected_token is
+    given, the cache is only cleared while it still holds that token, so concurrent
+    requests that all hit a 401 trigger a single refresh.
+    """
+    with _TOKEN_LOCK:
+        cached = _TOKEN_CACHE.get(scope or "")
+        if rejected_token and cached and cached["token"] != rejected_token:
+            return
+        _TOKEN_CACHE.pop(scope or "", None)
+        timer = _REFRESH_TIMERS.pop(scope or "", None)
+        if timer:
+            timer.cancel()
+
+def _auth_headers(scope: str = None, access_token: str = None) -> Optional[Dict[str, str]]:
+    """
+    Returns the Authorization header for a Zoho API call, or None if no access token
+    could be obtained. Tokens come from get_access_token, which refreshes them ahead of
+    their expiry, so callers don't discover a stale token through a failed request.
+    
+    Args:
+        scope: Optional scope to request the access token with
+        access_token: Optional existing access token to use instead of the cache
+    """
+    access_token = access_token or get_access_token(scope)
+    if not access_token:
         return None
+    return {"Authorization": f"Zoho-oauthtoken {access_token}"}
+
+def _send_with_token_retry(method: str, url: str, headers: Dict[str, str], scope: str = None, **kwargs) -> requests.Response:
+    """
+    Sends an authenticated request to Zoho. If the (cached) token is rejected with a
+    401, evicts it and retries once with a freshly refreshed token.
+    
+    Args:
+        method: HTTP method, e.g. 'GET' or 'POST'
+        url: The Zoho endpoint to call
+        headers: Request headers including the Authorization header
+        scope: The scope the access token in headers was requested with
+        **kwargs: Passed through to requests
+    """
+    kwargs.setdefault('timeout', _DEFAULT_TIMEOUT)
+    response = _SESSION.request(method, url, headers=headers, **kwargs)
+    if response.status_code == 401:
+        logger.debug("Zoho rejected the access token for %s %s; refreshing and retrying once", method, url)
+        # Only evict the token this request sent, so concurrent 401s refresh it once
+        rejected_token = headers.get("Authorization", "").rpartition(" ")[2]
+        _invalidate_access_token(scope, rejected_token)
+        auth_headers = _auth_headers(scope)
+        if auth_headers:
+            headers = {**headers, **auth_headers}
+            response = _SESSION.request(method, url, headers=headers, **kwargs)
+    return response
 
-def _parse_note_content_to_dict(note_content_str: str) -> Dict[str, Optional[str]]:
+def _refresh_token_in_background(scope: Optional[str]):
+    """
+    Timer callback that refreshes the cached token for a scope. A successful refresh
+    schedules the next one; on failure the next get_access_token call refreshes instead.
+    """
+    with _TOKEN_LOCK:
+        _REFRESH_TIMERS.pop(scope or "", None)
+        _refresh_access_token(scope)
+
+# Matches a file URL up to the first whitespace character
+_URL_RE = re.compile(r'https?://\S+')
+
+# Fields that bare URLs in a note are assigned to, in order
+_FILE_SLOTS = ("first_file", "second_file")
+
+def _extract_url(line: str) -> Optional[str]:
+    """Returns the first URL in a line of note content, or None."""
+    url_match = _URL_RE.search(line)
+    return url_match.group(0) if url_match else None
+
+# Keys that can follow challenge_notes in a form note; a line starting with one of
+# them marks the end of the multi-line challenge_notes value
+_CHALLENGE_NOTES_END_RE = re.compile(
+    r'(?:challenge_shape_notes|challenge_size|first_file|second_file|lead_source)[ \t]*:',
+    re.IGNORECASE
+)
+
+class ParsedNote(TypedDict):
+    """The fields extracted from a webhook form note; missing fields are None."""
+    first_name: Optional[str]
+    last_name: Optional[str]
+    type_1: Optional[str]
+    lead_source: Optional[str]
+    date: Optional[str]
+    organization_name: Optional[str]
+    challenge_notes: Optional[str]
+    challenge_size: Optional[str]
+    first_file: Optional[str]
+    second_file: Optional[str]
+
+_TARGET_KEYS = tuple(ParsedNote.__annotations__)
+
+# Maps the key spellings used in webhook form notes to the canonical field names
+_KEY_ALIASES: Dict[str, str] = {
+    "first name": "first_name", "firstname": "first_name", "first_name": "first_name",
+    "last name": "last_name", "lastname": "last_name", "last_name": "last_name",
+    "type": "type_1", "type_1": "type_1",
+    "source": "lead_source", "lead source": "lead_source", "lead_source": "lead_source",
+    "date": "date",
+    "organization": "organization_name", "org": "organization_name", "company": "organization_name",
+    "organization_name": "organization_name", "organization name": "organization_name",
+    "notes": "challenge_notes", "challenge notes": "challenge_notes", "challenge_notes": "challenge_notes",
+    "size": "challenge_size", "challenge size": "challenge_size", "challenge_size": "challenge_size",
+    "file1": "first_file", "first file": "first_file", "first_file": "first_file",
+    "file2": "second_file", "second file": "second_file", "second_file": "second_file",
+}
+
+def _parse_note_content_to_dict(note_content_str: str) -> ParsedNote:
     """
     Parses a string of key-value pairs (separated by ': ') into a dictionary.
     Extracts a predefined set of keys.
     Specifically handles challenge_notes by extracting all content between 
-    'challenge_notes:' and '\nchallenge_shape_notes:' markers.
+    'challenge_notes:' and the next known field marker (e.g. 'challenge_shape_notes:').
     If the content isn't in key-value format, treats it as challenge_notes.
     """
-    parsed_data: Dict[str, Optional[str]] = {}
     raw_fields: Dict[str, str] = {}
+    sniffed_files: Dict[str, str] = {}  # Bare URLs, used only for file slots with no explicit key
     non_kv_lines = []
 
     if not note_content_str or not isinstance(note_content_str, str):
-        print("DEBUG: _parse_note_content_to_dict received empty or invalid content.")
+        logger.debug("_parse_note_content_to_dict received empty or invalid content.")
         # Initialize target keys with None if content is bad
-        for key in [
-            "first_name", "last_name", "type_1", "lead_source", "date", 
-            "organization_name", "challenge_notes", "challenge_size", 
-            "first_file", "second_file"
-        ]:
-            parsed_data[key] = None
-        return parsed_data
-    
-    # First, extract challenge_notes specially since it may contain newlines
-    challenge_notes = None
-    challenge_notes_start = note_content_str.find("challenge_notes:")
-    if challenge_notes_start != -1:
-        # Find the start of the challenge_notes value (after the colon)
-        value_start = challenge_notes_start + len("challenge_notes:")
-        
-        # Find the next marker after challenge_notes
-        next_marker = note_content_str.find("\nchallenge_shape_notes:", value_start)
-        if next_marker != -1:
-            challenge_notes = note_content_str[value_start:next_marker].strip()
-            print(f"DEBUG: Extracted challenge_notes with newlines. First 50 chars: {challenge_notes[:50]}...")
+        return dict.fromkeys(_TARGET_KEYS)
+    
+    # Single pass over the note. challenge_notes may span several lines, so once its
+    # marker is seen the following lines are absorbed until the next known field marker.
+    lines = note_content_str.splitlines(True)
+    line_count = len(lines)
+    block_line = -1  # Index of the line that opened the challenge_notes block, if inside one
+    block_offset = 0  # Offset of that line within the note
+    value_start = 0  # Offset just past the 'challenge_notes:' marker
+    block_tried = False  # Only the first 'challenge_notes:' marker can open a block
+    offset = 0
+    i = 0
+    while True:
+        if i == line_count:
+            if block_line == -1:
+                break
+            # No field marker closed the block, so challenge_notes isn't multi-line
+            # after all; rescan those lines as ordinary content
+            i, offset = block_line, block_offset
+            block_line = -1
+            continue
+
+        # raw_fields only ever holds explicit target keys and each key keeps its first
+        # value, so once it is full the rest of the note (often a long quoted email
+        # thread) can't change the result. A challenge_notes value from an alias (e.g. 'notes:')
+        # doesn't count until the 'challenge_notes:' block has been read, since that
+        # block takes precedence.
+        if (len(raw_fields) == len(_TARGET_KEYS) and raw_fields["challenge_notes"]
+                and block_tried and block_line == -1):
+            break
+
+        raw_line = lines[i]
+        line_start = offset
+        offset += len(raw_line)
+        i += 1
+
+        if block_line != -1:
+            if not _CHALLENGE_NOTES_END_RE.match(raw_line):
+                continue
+            challenge_notes = note_content_str[value_start:line_start].strip()
+            logger.debug("Extracted challenge_notes with newlines. First 50 chars: %s...", challenge_notes[:50])
             raw_fields["challenge_notes"] = challenge_notes
-            
-            # Create a modified string for the rest of the parsing by removing the challenge_notes section
-            # We'll replace it with a simple placeholder that won't be processed again
-            note_content_str = (note_content_str[:challenge_notes_start] + 
-                               "challenge_notes: [EXTRACTED]" + 
-                               note_content_str[next_marker:])
-    
-    # Check for URLs in the content which might be files
-    for line in note_content_str.strip().split('\n'):
-        # Skip the placeholder we inserted
-        if line.strip() == "challenge_notes: [EXTRACTED]":
+            block_line = -1
+            # The marker line is itself a field, so parse it below
+        elif not block_tried:
+            marker_pos = raw_line.find("challenge_notes:")
+            if marker_pos != -1:
+                block_tried = True
+                block_line, block_offset = i - 1, line_start
+                value_start = line_start + marker_pos + len("challenge_notes:")
+                continue
+
+        line = raw_line.rstrip()
+        if not line:
+            # Keep blank lines as paragraph breaks in case these become challenge_notes
+            if non_kv_lines:
+                non_kv_lines.append(line)
             continue
             
         if "http" in line and "." in line:
-            # This could be a file URL, check for common patterns
-            if "first_file:" not in line.lower() and "second_file:" not in line.lower():
-                if "first_file" not in raw_fields:
-                    url_start = line.find("http")
-                    url_end = len(line)
-                    for suffix in [" ", "\n", "\r"]:
-                        pos = line.find(suffix, url_start)
-                        if pos != -1 and pos < url_end:
-                            url_end = pos
-                    url = line[url_start:url_end].strip()
-                    print(f"DEBUG: Found URL in content, treating as first_file: {url}")
-                    raw_fields["first_file"] = url
-                    continue
-                elif "second_file" not in raw_fields:
-                    url_start = line.find("http")
-                    url_end = len(line)
-                    for suffix in [" ", "\n", "\r"]:
-                        pos = line.find(suffix, url_start)
-                        if pos != -1 and pos < url_end:
-                            url_end = pos
-                    url = line[url_start:url_end].strip()
-                    print(f"DEBUG: Found URL in content, treating as second_file: {url}")
-                    raw_fields["second_file"] = url
-                    continue
+            # This could be a file URL, as long as a file slot is still free and the
+            # line isn't an explicit first_file:/second_file: entry
+            slot = next((name for name in _FILE_SLOTS
+                         if name not in raw_fields and name not in sniffed_files), None)
+            if slot:
+                lowered = line.lower()
+                if "first_file:" not in lowered and "second_file:" not in lowered:
+                    url = _extract_url(line)
+                    if url:
+                        logger.debug("Found URL in content, treating as %s: %s", slot, url)
+                        sniffed_files[slot] = url
+                        continue
 
         # Try to parse as key-value
-        parts = line.split(':', 1) # Split only on the first colon
-        if len(parts) == 2:
-            key = parts[0].strip().lower()
-            value = parts[1].strip()
+        key, sep, value = line.partition(':') # Split only on the first colon
+        if sep:
+            key = key.strip().lower()
+            value = value.strip()
             
-            # Map to our expected keys - handle common variations
-            if key in ["first name", "firstname", "first_name"]:
-                raw_fields["first_name"] = value
-            elif key in ["last name", "lastname", "last_name"]:
-                raw_fields["last_name"] = value
-            elif key in ["type", "type_1"]:
-                raw_fields["type_1"] = value
-            elif key in ["source", "lead source", "lead_source"]:
-                raw_fields["lead_source"] = value
-            elif key in ["date"]:
-                raw_fields["date"] = value
-            elif key in ["organization", "org", "company", "organization_name", "organization name"]:
-                raw_fields["organization_name"] = value
-            # Skip challenge_notes key-value processing as we've already handled it specially
-            elif key in ["notes", "challenge notes", "challenge_notes"]:
-                # Only set if we haven't extracted it specially earlier
-                if "challenge_notes" not in raw_fields:
-                    raw_fields["challenge_notes"] = value
-            elif key in ["size", "challenge size", "challenge_size"]:
-                raw_fields["challenge_size"] = value
-            elif key in ["file1", "first file", "first_file"]:
-                raw_fields["first_file"] = value
-            elif key in ["file2", "second file", "second_file"]:
-                raw_fields["second_file"] = value
-            else:
-                # Unknown key, but still in key:value format
-                raw_fields[key] = value
+            # Map to our expected keys - handle common variations; unknown keys are ignored.
+            # The first value for a field wins, so repeated keys further down (e.g. in a
+            # quoted email thread) never override the form's own values
+            canonical = _KEY_ALIASES.get(key)
+            if canonical:
+                raw_fields.setdefault(canonical, value)
         else:
             # Not a key-value pair, collect for potential challenge_notes
-            print(f"DEBUG: Collecting non key-value line for challenge_notes: '{line}'")
+            logger.debug("Collecting non key-value line for challenge_notes: '%s'", line)
             non_kv_lines.append(line)
 
-    # Define the specific keys we want to extract
-    target_keys = [
-        "first_name", "last_name", "type_1", "lead_source", "date", 
-        "organization_name", "challenge_notes", "challenge_size", 
-        "first_file", "second_file"
-    ]
+    # An explicit first_file:/second_file: entry always beats a bare URL, even one on an earlier line
+    for slot, url in sniffed_files.items():
+        raw_fields.setdefault(slot, url)
 
-    for key in target_keys:
-        parsed_data[key] = raw_fields.get(key) # Use .get() to default to None if key is missing
+    # raw_fields only holds target keys; any that weren't found default to None
+    parsed_data: ParsedNote = dict.fromkeys(_TARGET_KEYS)
+    parsed_data.update(raw_fields)
     
     # If we have non-key-value lines and no challenge_notes were set,
     # use the collected non-KV lines as challenge_notes
     if non_kv_lines and not parsed_data.get("challenge_notes"):
-        parsed_data["challenge_notes"] = "\n".join(non_kv_lines)
-        print(f"DEBUG: Set challenge_notes from non key-value content: {parsed_data['challenge_notes']}")
+        parsed_data["challenge_notes"] = "\n".join(non_kv_lines).strip()
+        logger.debug("Set challenge_notes from non key-value content: %s", parsed_data['challenge_notes'])
 
     return parsed_data
 
+# Title of the note Zoho creates from the website form submission
+_WEBHOOK_NOTE_TITLE = "Form(WEBHOOK) FIELD VALUES"
+
+def _is_cacheable_note(result: Optional[Dict[str, Any]]) -> bool:
+    """Only successfully parsed notes are cached; errors and 'no notes' results are retried."""
+    return bool(result) and "error" not in result and "info" not in result
+
+# The app re-runs on every widget interaction, so cache parsed notes briefly per order
+@_ttl_cache(seconds=300, should_cache=_is_cacheable_note)
 def get_note_from_zoho(order_id: str) -> Optional[Dict[str, Any]]: # Return type changed
     """
     Fetches the first created note for a given order_id (Deal ID) from Zoho CRM,
     parses its content, and returns a dictionary of key fields.
-    Assumes the last note in the API's default returned list is the first one submitted.
+    Only the oldest few notes are requested, sorted by creation time, since the
+    webhook form note is created together with the deal.
     """
     if not order_id:
-        print("DEBUG: get_note_from_zoho called with no order_id.")
+        logger.debug("get_note_from_zoho called with no order_id.")
         return {"error": "order_id is required."}
 
-    print(f"DEBUG: Attempting to fetch notes for Deal ID: {order_id} to find the first submitted (assuming last in default API list).")
+    logger.debug("Attempting to fetch notes for Deal ID: %s to find the first submitted.", order_id)
     
-    access_token = get_access_token()
-    if not access_token:
-        print("DEBUG: Failed to obtain Zoho access token. Cannot proceed with API call.")
+    headers = _auth_headers()
+    if not headers:
+        logger.debug("Failed to obtain Zoho access token. Cannot proceed with API call.")
         return {"error": "Could not authenticate with Zoho."}
     
-    print(f"DEBUG: Obtained Zoho access token. Proceeding to fetch notes for Deal ID: {order_id}")
+    logger.debug("Obtained Zoho access token. Proceeding to fetch notes for Deal ID: %s", order_id)
 
     notes_url = f"{ZOHO_API_BASE_URL}/crm/v2/Deals/{order_id}/Notes"
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}"
-    }
     params = {
-        "per_page": 50 
+        "per_page": 5,
+        "sort_by": "Created_Time",
+        "sort_order": "asc",
+        "fields": "Note_Title,Note_Content"
     }
 
+    response = None
     try:
-        print(f"DEBUG: Calling Zoho API: GET {notes_url} with params {params}")
-        response = requests.get(notes_url, headers=headers, params=params)
+        logger.debug("Calling Zoho API: GET %s with params %s", notes_url, params)
+        response = _send_with_token_retry('GET', notes_url, headers, params=params)
         response.raise_for_status()  
 
-        response_data = response.json()
+        response_data = _json_loads(response.content)
         notes_list = response_data.get('data')
 
-        if notes_list and len(notes_list) > 0:
-            print(f"DEBUG: Fetched {len(notes_list)} notes from Zoho API. Looking for a note with title 'Form(WEBHOOK) FIELD VALUES'.")
+        if notes_list:
+            logger.debug("Fetched %d notes from Zoho API. Looking for a note with title '%s'.", len(notes_list), _WEBHOOK_NOTE_TITLE)
             
-            # Try to find a note with title "Form(WEBHOOK) FIELD VALUES"
+            # Try to find the webhook form note
             webhook_form_note = None
             
-            # Check the last few notes (if available) to find our target note
-            notes_to_check = notes_list[-5:] if len(notes_list) >= 5 else notes_list
-            
-            for note in reversed(notes_to_check):  # Check from most recent to oldest
-                note_title = note.get('Note_Title', '')
-                if note_title and 'Form(WEBHOOK) FIELD VALUES' in note_title:
+            # Notes are returned oldest first, so the first match is the original submission
+            for note in notes_list:
+                note_title = note.get('Note_Title')
+                if note_title and _WEBHOOK_NOTE_TITLE in note_title:
                     webhook_form_note = note
-                    print(f"DEBUG: Found note with title '{note_title}'")
+                    logger.debug("Found note with title '%s'", note_title)
                     break
             
-            # If we didn't find a specific note, fall back to the last note
-            if not webhook_form_note and len(notes_list) > 0:
-                webhook_form_note = notes_list[-1]
-                print(f"DEBUG: Did not find a note with 'Form(WEBHOOK) FIELD VALUES' title. Using the last note instead.")
+            # If we didn't find a specific note, fall back to the oldest note
+            if not webhook_form_note:
+                webhook_form_note = notes_list[0]
+                logger.debug("Did not find a note with '%s' title. Using the oldest note instead.", _WEBHOOK_NOTE_TITLE)
             
-            if webhook_form_note:
-                print("\nDEBUG: Full data for the selected note:")
-                print(json.dumps(webhook_form_note, indent=2))
-                print("--------------------------------------------------\n")
+            # Only pay for pretty-printing the note when debug output is enabled
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Full data for the selected note:\n%s", _json_pretty(webhook_form_note))
 
-                note_content_str = webhook_form_note.get('Note_Content')
+            note_content_str = webhook_form_note.get('Note_Content')
                 
-                if note_content_str:
-                    parsed_note_data = _parse_note_content_to_dict(note_content_str)
-                    print(f"DEBUG: Parsed note content: {json.dumps(parsed_note_data, indent=2)}")
-                    return parsed_note_data
-                else:
-                    note_title = webhook_form_note.get('Note_Title', 'N/A')
-                    print(f"DEBUG: Selected note (Title: '{note_title}') has no content string.")
-                    # Return a dict with None for all target keys if content is missing
-                    return _parse_note_content_to_dict(None) # Will initialize target keys to None
+            if note_content_str:
+                parsed_note_data = _parse_note_content_to_dict(note_content_str)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Parsed note content: %s", _json_pretty(parsed_note_data))
+                return parsed_note_data
             else:
-                print("DEBUG: No notes found to process.")
-                return {"info": "No suitable notes found for this order ID."}
+                note_title = webhook_form_note.get('Note_Title', 'N/A')
+                logger.debug("Selected note (Title: '%s') has no content string.", note_title)
+                # Return a dict with None for all target keys if content is missing
+                return _parse_note_content_to_dict(None) # Will initialize target keys to None
         else:
-            print(f"DEBUG: No notes found for Deal ID: {order_id}. Response: {response_data}")
+            logger.debug("No notes found for Deal ID: %s. Response: %s", order_id, response_data)
             return {"info": "No notes found for this order ID."}
             
     except requests.exceptions.HTTPError as http_err:
-        error_response_text = "N/A"
-        try:
-            error_response_text = response.text
-        except: pass
-        print(f"DEBUG: HTTP error occurred while fetching Zoho note: {http_err} - Response: {error_response_text}")
+        logger.debug("HTTP error occurred while fetching Zoho note: %s - Response: %s", http_err, _response_snippet(response))
         try:
-            error_json = response.json()
+            error_json = _json_loads(response.content)
             if 'message' in error_json:
                 return {"error": f"Zoho API error - {error_json['message']} (Code: {error_json.get('code')})"}
         except ValueError:
             pass 
         return {"error": f"HTTP error {response.status_code} while fetching note from Zoho."}
     except requests.exceptions.RequestException as req_err:
-        print(f"DEBUG: Request exception occurred while fetching Zoho note: {req_err}")
+        logger.debug("Request exception occurred while fetching Zoho note: %s", req_err)
         return {"error": f"Network issue while contacting Zoho: {req_err}"}
     except ValueError as json_err: 
-        print(f"DEBUG: JSON decoding error occurred while parsing Zoho note response: {json_err} - Response: {response.text if 'response' in locals() else 'N/A'}")
+        logger.debug("JSON decoding error occurred while parsing Zoho note response: %s - Response: %s", json_err, _response_snippet(response))
         return {"error": "Could not parse response from Zoho."}
 
 
+def get_notes_from_zoho(order_ids: List[str], max_workers: int = 4) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Fetches and parses the form notes for several orders concurrently.
+    The lookups share the pooled session and cached access token, so the
+    network round-trips overlap instead of running back to back.
+    
+    Args:
+        order_ids: The Zoho CRM Deal IDs to look up
+        max_workers: Maximum number of concurrent requests to Zoho
+        
+    Returns:
+        Dictionary mapping each order ID to the result of get_note_from_zoho
+    """
+    if not order_ids:
+        return {}
+
+    # Fetch the token once up front so the workers don't queue on the refresh lock
+    get_access_token()
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(order_ids))) as executor:
+        futures = {executor.submit(get_note_from_zoho, order_id): order_id for order_id in order_ids}
+        for future in concurrent.futures.as_completed(futures):
+            order_id = futures[future]
+            try:
+                results[order_id] = future.result()
+            except Exception as e:
+                logger.debug("Unexpected error fetching note for Deal ID %s: %s", order_id, e)
+                results[order_id] = {"error": f"Unexpected error while fetching note: {e}"}
+    return results
+
+
+@_ttl_cache(seconds=300, should_cache=lambda folder: folder is not None)
 def get_miscellaneous_folder(order_id: str) -> Optional[Dict[str, str]]:
     """
     Fetches the "Miscellaneous Folder" field from the specified order/deal in Zoho CRM.
     Returns a dictionary with folder ID and folder URL, or None if not found.
+    Found folders are cached for a few minutes; failed lookups are not cached.
     
     Args:
         order_id: The Zoho CRM Deal ID
@@ -315,30 +648,27 @@ def get_miscellaneous_folder(order_id: str) -> Optional[Dict[str, str]]:
     Returns:
         Dictionary with keys 'id' and 'url' for the folder, or None if not found
     """
-    print(f"DEBUG: Getting miscellaneous folder for order {order_id}")
+    logger.debug("Getting miscellaneous folder for order %s", order_id)
     
     # First, get access token
-    access_token = get_access_token()
-    if not access_token:
-        print("DEBUG: Failed to get access token for retrieving miscellaneous folder")
+    headers = _auth_headers()
+    if not headers:
+        logger.debug("Failed to get access token for retrieving miscellaneous folder")
         return None
+    headers["Content-Type"] = "application/json"
     
     # Define API endpoint for getting Deal details
     deal_endpoint = f"{ZOHO_API_BASE_URL}/crm/v2/Deals/{order_id}"
-    
-    # Set up headers with access token
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}",
-        "Content-Type": "application/json"
-    }
+    # Only the folder field is needed, not the whole deal record
+    params = {"fields": "Miscellaneous_Folder"}
     
     try:
         # Make request to get deal details
-        response = requests.get(deal_endpoint, headers=headers)
+        response = _send_with_token_retry('GET', deal_endpoint, headers, params=params)
         response.raise_for_status()
         
         # Parse response
-        deal_data = response.json()
+        deal_data = _json_loads(response.content)
         
         # Check if we have data
         if 'data' in deal_data and len(deal_data['data']) > 0:
@@ -347,7 +677,7 @@ def get_miscellaneous_folder(order_id: str) -> Optional[Dict[str, str]]:
             # Check if 'Miscellaneous_Folder' field exists
             misc_folder = deal.get('Miscellaneous_Folder')
             if misc_folder:
-                print(f"DEBUG: Found Miscellaneous_Folder: {misc_folder}")
+                logger.debug("Found Miscellaneous_Folder: %s", misc_folder)
                 
                 # The field might be just a folder ID or a full URL
                 # If it's a URL, parse out the ID
@@ -370,23 +700,63 @@ def get_miscellaneous_folder(order_id: str) -> Optional[Dict[str, str]]:
                     'url': folder_url
                 }
             else:
-                print("DEBUG: No Miscellaneous_Folder field found in the deal")
+                logger.debug("No Miscellaneous_Folder field found in the deal")
         else:
-            print(f"DEBUG: No deal data found for ID {order_id}")
+            logger.debug("No deal data found for ID %s", order_id)
             
     except requests.exceptions.HTTPError as http_err:
-        print(f"DEBUG: HTTP error getting deal details: {http_err}")
+        logger.debug("HTTP error getting deal details: %s", http_err)
     except requests.exceptions.RequestException as req_err:
-        print(f"DEBUG: Request exception getting deal details: {req_err}")
+        logger.debug("Request exception getting deal details: %s", req_err)
     except ValueError as json_err:
-        print(f"DEBUG: JSON parsing error getting deal details: {json_err}")
+        logger.debug("JSON parsing error getting deal details: %s", json_err)
     except Exception as e:
-        print(f"DEBUG: Unexpected error getting miscellaneous folder: {str(e)}")
+        logger.debug("Unexpected error getting miscellaneous folder: %s", e)
     
     return None
 
 
-def upload_file_to_workdrive(folder_id: str, file_data, file_name: str, access_token: str = None, max_retries: int = 3) -> Optional[Dict[str, str]]:
+def _upload_retry_delay(response: requests.Response, retry_count: int, max_backoff: float) -> float:
+    """
+    Returns how many seconds to wait before upload retry number retry_count (1-based).
+    Honors a numeric Retry-After header from Zoho, otherwise uses exponential backoff
+    with jitter so concurrent uploads don't retry in lockstep. Both are capped at
+    max_backoff so a throttled upload can't stall the batch for minutes.
+    """
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            return min(max_backoff, max(0.0, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form, fall back to backoff
+    return min(max_backoff, 2 ** retry_count) * random.uniform(0.5, 1.0)
+
+def _uploaded_file_metadata(attributes: Dict[str, Any], file_name: str) -> Optional[Dict[str, str]]:
+    """
+    Builds the metadata returned for an uploaded file from the attributes of its entry
+    in a WorkDrive upload response, or returns None if they have no resource_id.
+    """
+    # The resource_id contains the file ID we need
+    if 'resource_id' not in attributes:
+        logger.debug("File resource_id not found in attributes: %s", attributes)
+        return None
+
+    file_id = attributes['resource_id']
+    logger.debug("File uploaded successfully with ID: %s", file_id)
+    
+    # Direct file link, as returned by get_workdrive_file_link while
+    # WorkDrive share links (which need URL Rules) are disabled
+    shareable_link = f"https://workdrive.zoho.com/file/{file_id}"
+    logger.debug("Generated shareable link: %s", shareable_link)
+    
+    return {
+        'id': file_id,
+        'name': file_name,
+        'url': shareable_link,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def upload_file_to_workdrive(folder_id: str, file_data, file_name: str, access_token: str = None, max_retries: int = 3, max_backoff: float = 10.0) -> Optional[Dict[str, str]]:
     """
     Uploads a file to a specified Zoho WorkDrive folder with retry logic.
     
@@ -396,88 +766,89 @@ def upload_file_to_workdrive(folder_id: str, file_data, file_name: str, access_t
         file_name: The name to give the file in WorkDrive
         access_token: Optional existing access token to reuse
         max_retries: Maximum number of retry attempts for rate limiting issues
+        max_backoff: Maximum number of seconds to wait between retries
         
     Returns:
         Dictionary with file metadata if successful, None otherwise
     """
-    print(f"DEBUG: Uploading {file_name} to WorkDrive folder {folder_id}")
-    print(f"DEBUG: File size: {len(file_data)} bytes")
+    logger.debug("Uploading %s to WorkDrive folder %s", file_name, folder_id)
+    logger.debug("File size: %d bytes", len(file_data))
     
-    # Get an access token if one wasn't provided
+    # Use the provided access token, otherwise get one with the WorkDrive scopes
+    access_token = access_token or get_access_token(_WORKDRIVE_SCOPE)
     if not access_token:
-        # We need CREATE to upload files and READ to get file details
-        access_token = get_access_token(scope="WorkDrive.files.CREATE WorkDrive.files.READ")
-        if not access_token:
-            print("DEBUG: Failed to get access token for WorkDrive upload")
-            return None
+        logger.debug("Failed to get access token for WorkDrive upload")
+        return None
+    headers = _auth_headers(access_token=access_token)
+    token_refreshed = False
         
     # Create the upload endpoint URL
     upload_endpoint = f"{ZOHO_WORKDRIVE_API_URL}/upload"
-    print(f"DEBUG: Using WorkDrive API endpoint: {upload_endpoint}")
-    
-    # Prepare headers
-    headers = {
-        'Authorization': f'Zoho-oauthtoken {access_token}'
-    }
-    print(f"DEBUG: Request headers: {headers}")
+    logger.debug("Using WorkDrive API endpoint: %s", upload_endpoint)
     
-    # Prepare files payload
-    files = {
-        'content': (file_name, file_data, 'application/octet-stream')
-    }
-    print(f"DEBUG: Using filename: {file_name}")
+    logger.debug("Using filename: %s", file_name)
     
     # Extract the folder ID string if it's a dictionary
     if isinstance(folder_id, dict) and 'id' in folder_id:
         folder_id = folder_id['id']
-        print(f"DEBUG: Extracted folder ID {folder_id} from folder_id dictionary")
+        logger.debug("Extracted folder ID %s from folder_id dictionary", folder_id)
     
     # Create the params dictionary with just the folder ID string
     params = {
         'parent_id': folder_id
     }
-    print(f"DEBUG: Request parameters: {params}")
+    logger.debug("Request parameters: %s", params)
     
     retry_count = 0
-    retry_delay = 1  # Start with 1 second delay
+    retry_delay = 0.0
     response = None  # Initialize outside the loop
     
     while retry_count <= max_retries:
         try:
             # Make request to upload file
             if retry_count == 0:
-                print("DEBUG: Sending upload request...")
+                logger.debug("Sending upload request...")
             else:
-                print(f"DEBUG: Retry attempt {retry_count}/{max_retries} after waiting {retry_delay:.1f}s...")
+                logger.debug("Retry attempt %s/%s after waiting %.1fs...", retry_count, max_retries, retry_delay)
             
-            response = requests.post(upload_endpoint, headers=headers, params=params, files=files)
+            upload_kwargs = _multipart_upload_kwargs([(file_data, file_name)])
+            request_headers = {**headers, **upload_kwargs.pop('headers', {})}
+            response = _SESSION.post(upload_endpoint, headers=request_headers, params=params, timeout=_UPLOAD_TIMEOUT, **upload_kwargs)
             
             # Log response status and headers before raising for status
-            print(f"DEBUG: Response status code: {response.status_code}")
+            logger.debug("Response status code: %s", response.status_code)
             
             # Try to get response body even if status code indicates error
             try:
-                response_body = response.json()
+                response_body = _json_loads(response.content)
                 if retry_count == 0:  # Only log detailed response on first attempt
-                    print(f"DEBUG: Response body: {response_body}")
+                    logger.debug("Response body: %s", response_body)
             except Exception as json_err:
-                print(f"DEBUG: Could not parse response as JSON: {str(json_err)}")
-                print(f"DEBUG: Raw response text: {response.text[:100]}..." if len(response.text) > 100 else response.text)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Could not parse response as JSON: %s - Raw response text: %s",
+                                 json_err, _response_snippet(response, 100))
                 response_body = {}
             
+            # The token expired or was revoked: refresh it once without using up a retry
+            if response.status_code == 401 and not token_refreshed:
+                logger.debug("WorkDrive rejected the access token; refreshing and retrying once")
+                token_refreshed = True
+                _invalidate_access_token(_WORKDRIVE_SCOPE, access_token)
+                fresh_token = get_access_token(_WORKDRIVE_SCOPE)
+                if fresh_token:
+                    access_token = fresh_token
+                    headers = _auth_headers(access_token=access_token)
+                    continue
+            
             # Check for rate limiting or specific errors that warrant a retry
-            if response.status_code == 429 or \
+            if response.status_code in (429, 503) or \
                (response.status_code == 500 and \
                 response_body.get('errors', [{}])[0].get('title') == 'MORE_THAN_MAX_OCCURANCE'):
                 
                 if retry_count < max_retries:
-                    # Exponential backoff with jitter
-                    import random
-                    import time
                     retry_count += 1
-                    jitter = random.uniform(0.5, 1.5)  # Add 50% jitter
-                    retry_delay = min(60, retry_delay * 2 * jitter)  # Double delay with each retry, max 60s
-                    print(f"DEBUG: Rate limit or API error detected. Retrying in {retry_delay:.1f} seconds...")
+                    retry_delay = _upload_retry_delay(response, retry_count, max_backoff)
+                    logger.debug("Rate limit or API error detected. Retrying in %.1f seconds...", retry_delay)
                     time.sleep(retry_delay)
                     continue
             
@@ -488,73 +859,164 @@ def upload_file_to_workdrive(folder_id: str, file_data, file_name: str, access_t
             break
             
         except requests.exceptions.HTTPError as http_err:
-            if response and response.status_code == 429:  # Rate limiting
-                if retry_count < max_retries:
-                    retry_count += 1
-                    print(f"DEBUG: Rate limited (429). Retrying {retry_count}/{max_retries}...")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay = min(60, retry_delay * 2)  # Double delay with each retry, max 60s
-                    continue
-            
-            # For non-retryable errors or max retries reached
-            print(f"DEBUG: HTTP error during file upload: {http_err}")
+            # Non-retryable error, or rate limited with no retries left
+            logger.debug("HTTP error during file upload: %s", http_err)
             return None
             
         except requests.exceptions.RequestException as req_err:
-            print(f"DEBUG: Request exception during file upload: {req_err}")
+            logger.debug("Request exception during file upload: %s", req_err)
             return None
     
     try:
         # Parse response for successful upload
-        upload_data = response.json()
+        upload_data = _json_loads(response.content)
         
         # Extract file ID and get a shareable link
         # Based on the actual response structure from Zoho WorkDrive
         if ('data' in upload_data and isinstance(upload_data['data'], list) and 
                 len(upload_data['data']) > 0 and 'attributes' in upload_data['data'][0]):
-            
-            attributes = upload_data['data'][0]['attributes']
-            
-            # The resource_id contains the file ID we need
-            if 'resource_id' in attributes:
-                file_id = attributes['resource_id']
-                print(f"DEBUG: File uploaded successfully with ID: {file_id}")
-                
-                shareable_link = get_workdrive_file_link(file_id, access_token)
-                print(f"DEBUG: Generated shareable link: {shareable_link}")
-                
-                # Return metadata
-                return {
-                    'id': file_id,
-                    'name': file_name,
-                    'url': shareable_link,
-                    'timestamp': datetime.now().isoformat()
-                }
-            else:
-                print(f"DEBUG: File resource_id not found in attributes: {attributes}")
+            return _uploaded_file_metadata(upload_data['data'][0]['attributes'], file_name)
         else:
-            print(f"DEBUG: Upload appeared to succeed but unexpected response structure")
+            logger.debug("Upload appeared to succeed but unexpected response structure")
     except Exception as e:
-        print(f"DEBUG: Error processing successful response: {str(e)}")
-        import traceback
-        print(f"DEBUG: Error traceback: {traceback.format_exc()[:200]}...")  # Truncate traceback to avoid excessive logging
+        logger.debug("Error processing successful response: %s", e)
+        logger.debug("Error traceback: %s...", traceback.format_exc()[:200])  # Truncate traceback to avoid excessive logging
     
     return None
 
 
+def _upload_files_in_one_request(folder_id, files: List[Tuple[bytes, str]], access_token: str) -> Tuple[List[Optional[Dict[str, str]]], List[int]]:
+    """
+    Uploads several files to a WorkDrive folder with a single multipart POST.
+    POSTs are never replayed blindly: files are only handed back for individual
+    upload when WorkDrive definitely didn't store them. If the outcome is unclear
+    they may already be stored, and re-sending them would create duplicates.
+    
+    Returns:
+        Tuple of (results, retry). results holds the upload metadata for each file,
+        in the same order as files, with None for any file not stored. retry lists
+        the indexes of files known not to be stored, which the caller can safely
+        upload individually: all of them if the request was rejected (a 4xx, or
+        the connection was never made), or those missing from a successful response
+        (e.g. if WorkDrive only kept one file). After a transport error once the
+        request was sent, a 5xx or an unreadable response, retry is empty.
+    """
+    results: List[Optional[Dict[str, str]]] = [None] * len(files)
+    if isinstance(folder_id, dict) and 'id' in folder_id:
+        folder_id = folder_id['id']
+
+    upload_kwargs = _multipart_upload_kwargs(files)
+    headers = {**_auth_headers(access_token=access_token), **upload_kwargs.pop('headers', {})}
+    try:
+        response = _SESSION.post(f"{ZOHO_WORKDRIVE_API_URL}/upload", headers=headers,
+                                 params={'parent_id': folder_id}, timeout=_UPLOAD_TIMEOUT, **upload_kwargs)
+    except requests.exceptions.ConnectTimeout as e:
+        # Nothing was sent, so the files can safely be uploaded individually
+        logger.debug("Multi-file upload could not connect: %s", e)
+        return results, list(range(len(files)))
+    except requests.exceptions.RequestException as e:
+        logger.debug("Multi-file upload failed after sending; not retrying to avoid duplicates: %s", e)
+        return results, []
+
+    if 400 <= response.status_code < 500:
+        logger.debug("Multi-file upload rejected with status %s", response.status_code)
+        return results, list(range(len(files)))
+    if not response.ok:
+        logger.debug("Multi-file upload returned status %s; not retrying to avoid duplicates", response.status_code)
+        return results, []
+    try:
+        entries = [entry.get('attributes') or {} for entry in _json_loads(response.content).get('data') or []]
+    except (ValueError, AttributeError) as e:
+        logger.debug("Could not parse multi-file upload response: %s", e)
+        return results, []
+
+    # Match the reported files back by name, each entry claimed by at most one file.
+    # Position is only trusted if no entry could be matched by name at all.
+    entries_by_name: Dict[Any, List[Dict[str, Any]]] = {}
+    for attributes in entries:
+        entries_by_name.setdefault(attributes.get('FileName'), []).append(attributes)
+    matched_by_name = False
+    for idx, (_, file_name) in enumerate(files):
+        candidates = entries_by_name.get(file_name)
+        if candidates:
+            matched_by_name = True
+            results[idx] = _uploaded_file_metadata(candidates.pop(0), file_name)
+    if not matched_by_name and len(entries) == len(files):
+        for idx, ((_, file_name), attributes) in enumerate(zip(files, entries)):
+            results[idx] = _uploaded_file_metadata(attributes, file_name)
+
+    # A successful response is definitive about what was stored, so anything it
+    # doesn't list can be uploaded again without creating duplicates
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if missing:
+        logger.debug("%d of %d files missing from the multi-file upload response", len(missing), len(files))
+    return results, missing
+
+
+def upload_files_to_workdrive(folder_id: str, files: List[Tuple[bytes, str]], access_token: str = None, max_workers: int = 4) -> List[Optional[Dict[str, str]]]:
+    """
+    Uploads several files to a Zoho WorkDrive folder. They are first sent together in
+    one multipart request. Files WorkDrive definitely didn't store (the request was
+    rejected, e.g. as too large, or the response leaves them out) are then uploaded
+    individually, concurrently, sharing one access token and the pooled session
+    across uploads.
+    
+    Args:
+        folder_id: The WorkDrive folder ID to upload to
+        files: List of (file_data, file_name) pairs to upload
+        access_token: Optional existing access token to reuse
+        max_workers: Maximum number of concurrent uploads (kept low to respect Zoho's rate limits)
+        
+    Returns:
+        List with the upload metadata for each file, in the same order as files;
+        None for any file that failed to upload
+    """
+    if not files:
+        return []
+
+    # Get one access token up front rather than one per upload
+    if not access_token:
+        access_token = get_access_token(scope=_WORKDRIVE_SCOPE)
+        if not access_token:
+            logger.debug("Failed to get access token for WorkDrive uploads")
+            return [None] * len(files)
+
+    if len(files) > 1:
+        results, pending = _upload_files_in_one_request(folder_id, files, access_token)
+        if not pending:
+            return results
+        logger.debug("Uploading %d of %d files individually", len(pending), len(files))
+    else:
+        results, pending = [None], [0]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+        futures = {
+            executor.submit(upload_file_to_workdrive, folder_id, files[idx][0], files[idx][1], access_token): idx
+            for idx in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                logger.debug("Unexpected error uploading %s: %s", files[idx][1], e)
+    return results
+
+
 def get_workdrive_file_link(file_id: str, access_token: str = None) -> str:
     """
     Helper function to get a direct link for a WorkDrive file.
+    upload_file_to_workdrive builds the same direct link inline; this is kept for
+    existing callers and for the share-link code below.
     
     Args:
         file_id: The WorkDrive file ID
-        access_token: Valid Zoho access token (optional, will fetch one with WorkDrive scope if None)
+        access_token: Unused while share links are disabled (see below)
         
     Returns:
         Direct link URL for the file
     """
-    print(f"DEBUG: Getting link for file {file_id}")
+    logger.debug("Getting link for file %s", file_id)
     
     # Note: URL Rule Configuration Error
     # To create shareable links via API, the WorkDrive account needs URL Rules configured
@@ -565,7 +1027,7 @@ def get_workdrive_file_link(file_id: str, access_token: str = None) -> str:
     
     # Return the direct file URL
     direct_link = f"https://workdrive.zoho.com/file/{file_id}"
-    print(f"DEBUG: Using direct file link: {direct_link}")
+    logger.debug("Using direct file link: %s", direct_link)
     return direct_link
     
     # The code below is left commented for future use if URL Rules are configured
@@ -575,7 +1037,7 @@ def get_workdrive_file_link(file_id: str, access_token: str = None) -> str:
     if not access_token:
         access_token = get_access_token(scope="WorkDrive.files.READ WorkDrive.files.UPDATE")
         if not access_token:
-            print("DEBUG: Failed to get access token for creating WorkDrive share link")
+            logger.debug("Failed to get access token for creating WorkDrive share link")
             return f"https://workdrive.zoho.com/file/{file_id}"  # Fallback to generic link
     
     # Define API endpoint for creating share link
@@ -605,7 +1067,7 @@ def get_workdrive_file_link(file_id: str, access_token: str = None) -> str:
         if 'data' in share_data and 'share_url' in share_data['data']:
             return share_data['data']['share_url']
     except Exception as e:
-        print(f"DEBUG: Error getting shareable link: {str(e)}")
+        logger.debug("Error getting shareable link: %s", e)
     
     # Return a generic link as fallback
     return f"https://workdrive.zoho.com/file/{file_id}"
@@ -624,33 +1086,29 @@ def create_note_with_file_links(order_id: str, links: List[Dict[str, str]]) -> b
     Returns:
         True if successful, False otherwise
     """
-    print(f"DEBUG: Creating note with file links for order {order_id}")
+    logger.debug("Creating note with file links for order %s", order_id)
     
     # First, get access token
-    access_token = get_access_token()
-    if not access_token:
-        print("DEBUG: Failed to get access token for creating note")
+    headers = _auth_headers()
+    if not headers:
+        logger.debug("Failed to get access token for creating note")
         return False
+    headers["Content-Type"] = "application/json"
     
     # Define API endpoint for creating a note
     notes_endpoint = f"{ZOHO_API_BASE_URL}/crm/v2/Deals/{order_id}/Notes"
     
-    # Set up headers with access token
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}",
-        "Content-Type": "application/json"
-    }
-    
     # Format the note content
     current_date = datetime.now().strftime("%Y-%m-%d %H:%M")
-    note_content = f"Generated Design Ideas\n\n"
+    note_lines = ["Generated Design Ideas", ""]
     
     # Add each file link to the note content
     for idx, link in enumerate(links, 1):
-        note_content += f"{idx}. {link['name']}: {link['url']}"
-        if 'description' in link and link['description']:
-            note_content += f" - {link['description']}"
-        note_content += "\n"
+        line = f"{idx}. {link['name']}: {link['url']}"
+        if link.get('description'):
+            line += f" - {link['description']}"
+        note_lines.append(line)
+    note_content = "\n".join(note_lines) + "\n"
     
     # Prepare the note data
     note_data = {
@@ -664,32 +1122,36 @@ def create_note_with_file_links(order_id: str, links: List[Dict[str, str]]) -> b
     
     try:
         # Make request to create the note
-        response = requests.post(notes_endpoint, headers=headers, json=note_data)
+        response = _send_with_token_retry('POST', notes_endpoint, headers, json=note_data)
         response.raise_for_status()
         
         # Parse response
-        result = response.json()
+        result = _json_loads(response.content)
         
         # Check if note creation was successful
         if 'data' in result and len(result['data']) > 0 and 'code' in result['data'][0] and result['data'][0]['code'] == 'SUCCESS':
             note_id = result['data'][0].get('details', {}).get('id')
-            print(f"DEBUG: Successfully created note with ID: {note_id}")
+            logger.debug("Successfully created note with ID: %s", note_id)
             return True
         else:
-            print(f"DEBUG: Note creation unsuccessful: {result}")
+            logger.debug("Note creation unsuccessful: %s", result)
             
     except requests.exceptions.HTTPError as http_err:
-        print(f"DEBUG: HTTP error creating note: {http_err}")
+        logger.debug("HTTP error creating note: %s", http_err)
     except requests.exceptions.RequestException as req_err:
-        print(f"DEBUG: Request exception creating note: {req_err}")
+        logger.debug("Request exception creating note: %s", req_err)
     except ValueError as json_err:
-        print(f"DEBUG: JSON parsing error creating note: {json_err}")
+        logger.debug("JSON parsing error creating note: %s", json_err)
     except Exception as e:
-        print(f"DEBUG: Unexpected error creating note: {str(e)}")
+        logger.debug("Unexpected error creating note: %s", e)
     
     return False
 
 
+# The resize and JPEG encode below are the CPU-heavy part of batch uploads. Pillow's
+# wheels bundle the SIMD libjpeg-turbo codec; note it in case a source build doesn't.
+logger.debug("Pillow JPEG codec is libjpeg-turbo: %s", features.check_feature("libjpeg_turbo"))
+
 def optimize_image_for_upload(image_data: bytes) -> Tuple[bytes, float, float]:
     """
     Optimizes an image for upload by resizing and compressing it.
@@ -710,48 +1172,129 @@ def optimize_image_for_upload(image_data: bytes) -> Tuple[bytes, float, float]:
         # Resize to exactly 400x400px (matching Streamlit thumbnail size)
         target_size = (400, 400)
         
+        # Images already at the target size and small enough are uploaded as-is; Image.open
+        # only reads the header, so this skips decoding, resizing and re-encoding entirely
+        if img.size == target_size and img.format in ('JPEG', 'PNG') and len(image_data) < 120_000:
+            return image_data, original_size, original_size
+        # Larger JPEGs at the target size are only replaced if re-encoding shrinks them
+        keep_smaller_original = img.format == 'JPEG' and img.size == target_size
+        
+        # For JPEG sources, let the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+        # (never below target_size), so far fewer pixels are decoded and resampled
+        if img.format == 'JPEG':
+            img.draft('RGB', target_size)
+        
         # Convert to RGB if it has alpha channel (for better JPEG compression)
         if img.mode == 'RGBA':
             # Create white background
             background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
+            # An RGBA image used as the mask supplies its own alpha band, so there's
+            # no need to split() out all four bands just to get at it
+            background.paste(img, mask=img)
             img = background
         elif img.mode != 'RGB':
             img = img.convert('RGB')
         
-        # Resize the image with a high-quality resampling method
-        img = img.resize(target_size, Image.LANCZOS)
+        # Resize the image with a high-quality resampling method. reducing_gap lets
+        # sources of 1600px or more (4x the target) be shrunk by a cheap integer box
+        # reduce first (e.g. 2048px -> 1024px), so LANCZOS only covers the last step
+        img = img.resize(target_size, Image.LANCZOS, reducing_gap=2.0)
         
-        # Save as JPEG with significant compression for much smaller file size
+        # Save as JPEG with significant compression for much smaller file size.
+        # Progressive scans are usually a little smaller at the same quality, and
+        # libjpeg always builds optimized Huffman tables for them, so optimize=True
+        # would be redundant. subsampling=2 pins 4:2:0 chroma subsampling.
         buffer = io.BytesIO()
-        img.save(buffer, format="JPEG", optimize=True, quality=70)
+        img.save(buffer, format="JPEG", quality=70, subsampling=2, progressive=True)
         optimized_image_data = buffer.getvalue()
         
+        # Re-encoding an already compressed JPEG can make it bigger; don't pay the extra
+        # generation of quality loss for that
+        if keep_smaller_original and len(optimized_image_data) >= len(image_data):
+            return image_data, original_size, original_size
+        
         # Calculate new size in KB
         new_size = len(optimized_image_data) / 1024
         
         return optimized_image_data, original_size, new_size
     except Exception as e:
-        print(f"DEBUG: Error optimizing image: {str(e)}. Returning original image.")
+        logger.debug("Error optimizing image: %s. Returning original image.", e)
         # Return original image if optimization fails
         return image_data, len(image_data) / 1024, len(image_data) / 1024
 
 
-def batch_upload_designs_to_workdrive(order_id: str, designs: List[Dict], progress_callback=None, status_callback=None):
+def _download_image(url: str) -> bytes:
+    """
+    Downloads an image, streaming the body into a single buffer. Unlike
+    response.content this doesn't hold the list of chunks and their joined copy at
+    the same time, and getvalue() hands back the buffer without another copy.
+    """
+    with _DOWNLOAD_SESSION.get(url, stream=True, timeout=10) as response:
+        response.raise_for_status()
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer.write(chunk)
+        return buffer.getvalue()
+
+
+def _prepare_design(idx: int, design: Dict) -> Optional[bytes]:
+    """
+    Downloads or decodes one design and optimizes it for upload.
+    Runs in a worker thread, so it reports problems through the log rather than
+    the caller's UI callbacks.
+    
+    Returns:
+        The optimized image bytes, or None if the image couldn't be obtained
+    """
+    design_style = design.get('style', f'variation_{idx}')
+    
+    # Get image data - either from URL or base64
+    image_data = None
+    if design.get("url"):
+        try:
+            image_data = _download_image(design.get("url"))
+        except Exception as e:
+            logger.debug("Failed to download image for %s from URL: %s", design_style, e)
+            return None
+    elif design.get("b64_json"):
+        try:
+            # Same decoding as base64.b64decode, minus its copy of the str into ASCII bytes
+            image_data = binascii.a2b_base64(design.get("b64_json"))
+        except Exception as e:
+            logger.debug("Failed to decode base64 image data for %s: %s", design_style, e)
+            return None
+    
+    if not image_data:
+        logger.debug("Failed to get image data for %s.", design_style)
+        return None
+    
+    # Optimize the image
+    optimized_data, original_size, new_size = optimize_image_for_upload(image_data)
+    
+    # Log the size reduction
+    if logger.isEnabledFor(logging.DEBUG):
+        reduction = (1 - (new_size / original_size)) * 100 if original_size > 0 else 0
+        logger.debug("Image resized from %.1fKB to %.1fKB (%.1f%% reduction)", original_size, new_size, reduction)
+    
+    return optimized_data
+
+
+def batch_upload_designs_to_workdrive(order_id: str, designs: List[Dict], progress_callback=None, status_callback=None, max_workers: int = 4):
     """
     Processes a batch of designs and uploads them to Zoho WorkDrive with optimization.
+    Designs are downloaded and optimized concurrently, then uploaded together (see
+    upload_files_to_workdrive); the callbacks are only invoked from the calling thread.
     
     Args:
         order_id: The Zoho CRM Deal ID
         designs: List of design dictionaries with 'style', 'url' or 'b64_json' keys
         progress_callback: Optional function to call with progress updates (0.0-1.0)
         status_callback: Optional function to call with status message updates
+        max_workers: Maximum number of designs processed at once (kept low to respect Zoho's rate limits)
     
     Returns:
         A tuple of (success_flag, list_of_successful_uploads, error_message)
     """
-    successful_uploads = []
-    
     # Update status if callback provided
     if status_callback:
         status_callback("Uploading all designs to Zoho WorkDrive...")
@@ -765,80 +1308,70 @@ def batch_upload_designs_to_workdrive(order_id: str, designs: List[Dict], progre
     if status_callback:
         status_callback("Getting Zoho access token for batch uploads...")
         
-    access_token = get_access_token(scope="WorkDrive.files.CREATE WorkDrive.files.READ")
+    access_token = get_access_token(scope=_WORKDRIVE_SCOPE)
     if not access_token:
         return False, [], "Failed to get Zoho access token for uploads."
     
-    # Prepare for batch uploads
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Prepare for batch uploads; every file name in the batch shares the same timestamp
+    filename_suffix = f"_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
     total_designs = len(designs)
     
-    for idx, selected_design in enumerate(designs):
-        design_style = selected_design.get('style', f'variation_{idx}')
-        filename = f"design_{design_style}_{timestamp}.png"
-        
-        # Update progress if callback provided
+    # Keep images in design order so the note lists them as they were generated
+    prepared: List[Optional[bytes]] = [None] * total_designs
+    if designs:
         if progress_callback:
-            progress = (idx) / total_designs
-            progress_callback(progress)
-            
+            progress_callback(0.0)
         if status_callback:
-            status_callback(f"Processing design {idx+1}/{total_designs}: {design_style}")
+            status_callback(f"Processing {total_designs} designs...")
         
-        # Get image data - either from URL or base64
-        image_data = None
-        if selected_design.get("url"):
-            try:
-                response = requests.get(selected_design.get("url"), timeout=10)
-                response.raise_for_status()
-                image_data = response.content
-            except Exception as e:
-                print(f"DEBUG: Failed to download image for {design_style} from URL: {e}")
-                continue
-        elif selected_design.get("b64_json"):
-            try:
-                image_data = base64.b64decode(selected_design.get("b64_json"))
-            except Exception as e:
-                print(f"DEBUG: Failed to decode base64 image data for {design_style}: {e}")
-                continue
-        
-        if not image_data:
-            print(f"DEBUG: Failed to get image data for {design_style}.")
-            continue
-        
-        # Optimize the image
-        if status_callback:
-            status_callback(f"Optimizing image {idx+1}/{total_designs}: {design_style} for upload")
-            
-        optimized_data, original_size, new_size = optimize_image_for_upload(image_data)
-        
-        # Log the size reduction
-        reduction = (1 - (new_size / original_size)) * 100 if original_size > 0 else 0
-        print(f"DEBUG: Image resized from {original_size:.1f}KB to {new_size:.1f}KB ({reduction:.1f}% reduction)")
-        
-        # Upload the file to WorkDrive using the shared token and with retry logic
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, total_designs)) as executor:
+            futures = {
+                executor.submit(_prepare_design, idx, design): idx
+                for idx, design in enumerate(designs)
+            }
+            # Report at most ~20 times per batch so UI updates don't dominate large batches
+            report_every = max(1, total_designs // 20)
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                idx = futures[future]
+                try:
+                    prepared[idx] = future.result()
+                except Exception as e:
+                    logger.debug("Unexpected error processing design %d: %s", idx, e)
+                
+                if done % report_every and done != total_designs:
+                    continue
+                design_style = designs[idx].get('style', f'variation_{idx}')
+                
+                # Update progress if callback provided; uploading is the second half
+                if progress_callback:
+                    progress_callback(done / total_designs / 2)
+                if status_callback:
+                    status_callback(f"Processed design {done}/{total_designs}: {design_style}")
+    
+    # Upload the prepared images to WorkDrive using the shared token
+    styles = []
+    files = []
+    for idx, design in enumerate(designs):
+        if prepared[idx] is not None:
+            design_style = design.get('style', f'variation_{idx}')
+            styles.append(design_style)
+            files.append((prepared[idx], "design_" + design_style + filename_suffix))
+    
+    successful_uploads = []
+    if files:
         if status_callback:
-            status_callback(f"Uploading design {idx+1}/{total_designs}: {design_style} to Zoho WorkDrive")
-            
-        upload_result = upload_file_to_workdrive(
-            folder_id=folder_id, 
-            file_data=optimized_data, 
-            file_name=filename,
-            access_token=access_token,  # Reuse the token for all uploads
-            max_retries=3  # Allow up to 3 retries with exponential backoff
-        )
-        
-        if not upload_result:
-            print(f"DEBUG: Failed to upload {design_style} to Zoho WorkDrive.")
-            continue
-        
-        # Add to successful uploads
-        successful_uploads.append({
-            'name': filename,
-            'url': upload_result['url'],
-            'id': upload_result['id'],
-            'style': design_style
-        })
+            status_callback(f"Uploading {len(files)} designs to Zoho WorkDrive...")
+        upload_results = upload_files_to_workdrive(folder_id, files, access_token=access_token, max_workers=max_workers)
+        for design_style, (_, filename), upload_result in zip(styles, files, upload_results):
+            if not upload_result:
+                logger.debug("Failed to upload %s to Zoho WorkDrive.", design_style)
+                continue
+            successful_uploads.append({
+                'name': filename,
+                'url': upload_result['url'],
+                'id': upload_result['id'],
+                'style': design_style
+            })
     
     # Complete the progress
     if progress_callback:
@@ -862,13 +1395,9 @@ def batch_upload_designs_to_workdrive(order_id: str, designs: List[Dict], progre
 
 
 if __name__ == '__main__':
-    import os
-    from PIL import Image
-    import io
-    
     # Example usage for direct testing (optional)
     print("--- Testing get_access_token() directly ---")
-    token = get_access_token("WorkDrive.files.CREATE WorkDrive.files.READ")
+    token = get_access_token(_WORKDRIVE_SCOPE)
     if token:
         print(f"Received Access Token (first 10 chars): {token[:10]}...")
     else:
@@ -909,37 +1438,12 @@ if __name__ == '__main__':
                 if os.path.exists(specific_file_path):
                     print(f"Found specific PNG file at {specific_file_path}")
                     
-                    # First test: upload original file
                     with open(specific_file_path, 'rb') as f:
-                        img_data = f.read()
+                        original_data = f.read()
                     
-                    file_size_kb = len(img_data) / 1024
+                    # Resize and compress the file before upload, as the batch upload does
+                    img_data, file_size_kb, new_size_kb = optimize_image_for_upload(original_data)
                     print(f"Original file size: {file_size_kb:.1f}KB")
-                    
-                    # Second test: resize and compress file before upload
-                    img = Image.open(specific_file_path)
-                    print(f"Original dimensions: {img.size}")
-                    
-                    # Resize to 400x400px and convert to JPEG
-                    target_size = (400, 400)
-                    
-                    # Convert to RGB if needed (for JPEG format)
-                    if img.mode == 'RGBA':
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[3])
-                        img = background
-                    elif img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # Resize the image
-                    img = img.resize(target_size, Image.LANCZOS)
-                    
-                    # Save as JPEG with compression
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG', optimize=True, quality=70)
-                    img_data = img_byte_arr.getvalue()
-                    
-                    new_size_kb = len(img_data) / 1024
                     print(f"After resizing/compression: {new_size_kb:.1f}KB (reduced by {(1 - new_size_kb/file_size_kb) * 100:.1f}%)")
                 else:
                     print(f"Specific PNG file not found at {specific_file_path}, creating a test image instead")